@@ -34,41 +34,38 @@ Decisiones del diseño:
 
 import os
 import requests
+import orjson
+import numpy as np
 import pandas as pd
 import pyarrow as pa
-import configparser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from deltalake import write_deltalake, DeltaTable
+from deltalake import DeltaTable
 from deltalake.exceptions import TableNotFoundError
-from deltalake.table import TableOptimizer
+from pipeline_utils import (
+    CRYPTO_PRICE_TYPES, MAX_REPLACE_PARTITIONS, create_session, get_storage_options, load_config_file,
+    count_rows, normalize_columns, save_data_as_delta, upsert_data_as_delta
+)
 
 # -----------------------------------------------------------------------
 # funciones auxiliares
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def load_config_file(filename):
-    # Carga un archivo .conf desde la carpeta config/
-    config_path = os.path.join(BASE_DIR, "config", filename)
-    if not os.path.exists(config_path):
-        print(f"No se encontró {config_path}.")
-        return None
-    parser = configparser.ConfigParser()
-    parser.read(config_path)
-    return parser
+# sesión HTTP compartida entre llamadas a la API
+SESSION = create_session()
 
 def get_data(base_url, endpoint, data_field=None, params=None, headers=None):
     # http a la API y devuelve datos en formato JSON
     try:
         endpoint_url = f"{base_url}/{endpoint}"
-        response = requests.get(endpoint_url, params=params, headers=headers)
+        response = SESSION.get(endpoint_url, params=params, headers=headers, timeout=(5, 30))
         response.raise_for_status()  # Levanta una excepción si hay un error en la respuesta HTTP.
 
         # Verificar si los datos están en formato JSON.
         try:
-            data = response.json()
+            data = orjson.loads(response.content)
             if data_field:
               data = data[data_field]
-        except:
+        except (orjson.JSONDecodeError, KeyError, TypeError):
             print("El formato de respuesta no es el esperado")
             return None
         return data
@@ -87,25 +84,28 @@ def build_dynamic_table(data):
         print(list(data.keys()))
         return None
     
-    df = pd.DataFrame.from_dict(data[series_key], orient="index")
-    df.columns = [c.split(". ")[-1].split(" (")[0] for c in df.columns]
-
-    df.index.name = "datetime"
-    df.reset_index(inplace=True)
-    df["datetime"] = pd.to_datetime(df["datetime"], format="%Y-%m-%d", errors="coerce")
+    # una sola pasada sobre el JSON: fechas y una matriz de strings (filas x columnas)
+    series = data[series_key]
+    keys = list(next(iter(series.values()), {}).keys())
+    raw = np.array([[row.get(k) for k in keys] for row in series.values()], dtype=object)
+    raw = raw.reshape(len(series), len(keys))
+
+    # conversión numérica de toda la matriz en un solo llamado (lo no numérico queda NaN)
+    # se parsea con precisión completa: el tipo final lo decide la tabla destino (upsert_data_as_delta)
+    values = pd.to_numeric(raw.ravel(), errors="coerce").reshape(raw.shape)
+
+    dates = list(series.keys())
+    df = pd.DataFrame(values, columns=[c.split(". ")[-1].split(" (")[0] for c in keys])
+    df.insert(0, "datetime", pd.to_datetime(dates, format="%Y-%m-%d", exact=True, errors="coerce", cache=True))
+
+    # particion por fecha: las claves de la API ya vienen como YYYY-MM-DD, se usan tal cual
+    df["date"] = dates
     df.sort_values(by="datetime", inplace=True)
 
-    for col in df.columns:
-        if col != "datetime":
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # particion por fecha
-    df["date"] = df["datetime"].dt.date.astype(str)
-
     return df
 
 def build_static_table(data):
-    # convierte datos estaticos en dataframe
+    # convierte datos estaticos en una tabla Arrow de una fila
     # extrae el diccionario principal
     try:
         rate = data["Realtime Currency Exchange Rate"]
@@ -113,70 +113,12 @@ def build_static_table(data):
         print("No se pudo obtener tipo de cambio USD/EUR. Se continuará sin FX.")
         return None
 
-    # Convierte en DataFrame
-    df = pd.DataFrame([rate])
-
     # Normaliza nombres de columnas automáticamente (sino el codigo falla porque aparecen nombres duplicados)
-    new_columns = []
-    seen = set()
-
-    for c in df.columns:
-        parts = c.split(" ")[1:]  # remueve el número y punto
-        col_name = "_".join(parts).lower()  # une con _
-        
-        # Si el nombre ya existe, agrega un sufijo numérico
-        base_name = col_name
-        counter = 1
-        while col_name in seen:
-            col_name = f"{base_name}_{counter}"
-            counter += 1
-
-        seen.add(col_name)
-        new_columns.append(col_name)
-
-    df.columns = new_columns
-    return df
+    names = normalize_columns(rate.keys())
 
-def save_data_as_delta(df, path, storage_options=None, mode="overwrite", partition_cols=None):  
-    # guarda los datos en formato delta lake 
-    write_deltalake(
-        path,
-        df,
-        mode=mode,
-        storage_options=storage_options,
-        partition_by=partition_cols
-    )
-
-def upsert_data_as_delta(data, data_path, predicate, storage_options=None, partition_cols=None):
-    # inserta nuevos datos o actualiza registros existentes
-    try:
-        dt = DeltaTable(data_path, storage_options=storage_options)
-        data_pa = pa.Table.from_pandas(data)
-        dt.merge(
-            source=data_pa,
-            source_alias="source",
-            target_alias="target",
-            predicate=predicate
-        ) \
-        .when_matched_update_all() \
-        .when_not_matched_insert_all() \
-        .execute()
-    except TableNotFoundError:
-        save_data_as_delta(data, data_path, storage_options, "overwrite", partition_cols)
-    
-
-def remove_duplicate_columns(df):
-    # Elimina columnas duplicadas automáticamente
-    seen = set()
-    new_cols = []
-    for c in df.columns:
-        if c not in seen:
-            new_cols.append(c)
-            seen.add(c)
-        else:
-            new_cols.append(f"{c}_dup")
-    df.columns = new_cols
-    return df
+    # una sola fila: tabla Arrow directa, sin pasar por un DataFrame de pandas
+    # (from_arrays conserva todas las columnas, un dict descartaría las repetidas)
+    return pa.Table.from_arrays([pa.array([value], pa.string()) for value in rate.values()], names=names)
 
 # -----------------------------------------------------------------------
 # funcion principal
@@ -210,21 +152,11 @@ if __name__ == "__main__":
     # sino, el data lake se crea de manera local 
 
     # cargar configuracion de almacenamiento (minio o local)
-    storage_config = load_config_file("storage.conf")
-    storage_options = None
+    storage_options = get_storage_options()
 
-    if storage_config and "minio" in storage_config:
+    if storage_options is not None:
         print("Usando almacenamiento en MinIO\n")
-        minio = storage_config["minio"]
-        storage_options = {
-            "AWS_ENDPOINT_URL": minio["AWS_ENDPOINT_URL"],
-            "AWS_ACCESS_KEY_ID": minio["AWS_ACCESS_KEY_ID"],
-            "AWS_SECRET_ACCESS_KEY": minio["AWS_SECRET_ACCESS_KEY"],
-            "AWS_ALLOW_HTTP": minio["AWS_ALLOW_HTTP"],
-            "aws_conditional_put": minio["aws_conditional_put"],
-            "AWS_S3_ALLOW_UNSAFE_RENAME": minio["AWS_S3_ALLOW_UNSAFE_RENAME"]
-        }
-        bucket_name = minio["bucket_name"]
+        bucket_name = load_config_file("storage.conf")["minio"]["bucket_name"]
         base_path = f"s3://{bucket_name}/bronze"
         bronze_api_path = f"{base_path}/alphavantage"
     else:
@@ -235,8 +167,6 @@ if __name__ == "__main__":
             bronze_api_path = f"{base_path}/alphavantage"
 
     # Endpoint dinámico - cotización cripto diaria - incremental: cada día se agrega un nuevo registro
-    print("Extracción dinámica: Precio diario de Bitcoin (BTC/USD)\n")
-
     params_dynamic = {
         "function": "DIGITAL_CURRENCY_DAILY",
         "symbol": "BTC",
@@ -244,7 +174,23 @@ if __name__ == "__main__":
         "apikey": api_key
     }
 
-    data_dynamic = get_data(base_url, endpoint="", params=params_dynamic)
+    # Endpoint estático - cotización actual - extracción full overwrite: un solo valor que se reemplaza en cada ejecución
+    params_static = {
+        "function": "CURRENCY_EXCHANGE_RATE",
+        "from_currency": "USD",
+        "to_currency": "EUR",
+        "apikey": api_key
+    }
+
+    # las dos llamadas son independientes: se hacen en paralelo y el tiempo total es el de la más lenta
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_dynamic = executor.submit(get_data, base_url, "", None, params_dynamic)
+        future_static = executor.submit(get_data, base_url, "", None, params_static)
+        data_dynamic = future_dynamic.result()
+        data_static = future_static.result()
+
+    print("Extracción dinámica: Precio diario de Bitcoin (BTC/USD)\n")
+
     if data_dynamic:
         df_dynamic = build_dynamic_table(data_dynamic)
         df_dynamic["ingestion_timestamp"] = datetime.now()
@@ -257,70 +203,60 @@ if __name__ == "__main__":
         if storage_options is None:
             os.makedirs(data_path_dynamic, exist_ok=True)
 
-        predicate = "target.datetime = source.datetime"
-
         try:
             dt = DeltaTable(data_path_dynamic, storage_options=storage_options)
-            prev_count = dt.to_pandas().shape[0]
-            # Si la tabla ya existe, hago UPSERT (merge)
-            data_pa = pa.Table.from_pandas(df_dynamic)
-            dt.merge(
-                source=data_pa,
-                source_alias="source",
-                target_alias="target",
-                predicate="target.datetime = source.datetime"
-            ) \
-            .when_matched_update_all() \
-            .when_not_matched_insert_all() \
-            .execute()
-
-            new_count = dt.to_pandas().shape[0]
+            prev_count = count_rows(dt)
+        except TableNotFoundError:
+            dt = None
+
+        # mismo upsert que main.py: solo filas desde el último datetime cargado (estadísticas del delta log),
+        # delete + append si tocan pocas particiones y merge con poda por particion si son muchas
+        # (sin el índice de pandas: quedó salteado por los filtros y se escribiría como columna)
+        upsert_data_as_delta(
+            pa.Table.from_pandas(df_dynamic, preserve_index=False),
+            data_path_dynamic,
+            predicate="target.date = source.date AND target.datetime = source.datetime",
+            storage_options=storage_options,
+            partition_cols=["date"],
+            partition_values=sorted(df_dynamic["date"].unique().tolist()),
+            since_col="datetime",
+            max_replace_partitions=MAX_REPLACE_PARTITIONS,
+            dt=dt,
+            types=CRYPTO_PRICE_TYPES,
+        )
+
+        if dt is not None:
+            new_count = count_rows(dt)
             print("Tabla Delta actualizada (UPSERT completado).")
             print(f"Filas antes: {prev_count}")
             print(f"Filas después: {new_count}")
             print(f"Filas nuevas insertadas/actualizadas: {new_count - prev_count}")
-        except TableNotFoundError:
-            write_deltalake(
-                data_path_dynamic,
-                df_dynamic,
-                mode="overwrite",
-                storage_options=storage_options,
-                partition_by=["date"],
-            )
-            print("Tabla Delta inicializada (estructura vacía creada).")
+        else:
+            print("Tabla Delta inicializada con los datos descargados (un único commit).")
 
+            # única apertura en este camino: la tabla recién se creó
+            dt = DeltaTable(data_path_dynamic, storage_options=storage_options)
             try:
-                dt = DeltaTable(data_path_dynamic, storage_options=storage_options)
                 dt.alter.add_constraint({"positive_close": "close > 0"})
-
-                # === Time Travel ===
-                last_version = dt.version()
-                print(f"Versión actual de la tabla: {last_version}")
-                print("Historial de versiones recientes:")
-                print(dt.history(3))  # últimas 3 versiones
             except Exception as e:
                 print("Mantenimiento omitido:", e)
 
+        # dt ya refleja el último commit (delete/append/merge lo actualizan), no hace falta reabrir;
+        # el historial completo (dt.history) queda para los scripts de maintenance/, fuera de la ingesta
+        print(f"Versión actual de la tabla: {dt.version()}")
+
         print("Datos dinámicos guardados.\n")
         print("=" * 60)
 
 
-    # Endpoint estático - cotización actual - extracción full overwrite: un solo valor que se reemplaza en cada ejecución
     print("Extracción estática: Cotización actual USD/EUR\n")
 
-    params_static = {
-        "function": "CURRENCY_EXCHANGE_RATE",
-        "from_currency": "USD",
-        "to_currency": "EUR",
-        "apikey": api_key
-    }
-
-    data_static = get_data(base_url, endpoint="", params=params_static)
     if data_static:
         df_static = build_static_table(data_static)
-        df_static = remove_duplicate_columns(df_static)
-        df_static["ingestion_timestamp"] = datetime.now()
-        print(df_static.head())   
+        df_static = df_static.append_column(
+            "ingestion_timestamp", pa.array([datetime.now()], pa.timestamp("us"))
+        )
+        print(df_static.to_pandas())
 
         data_path_static = f"{bronze_api_path}/currency_exchange_rate"
         
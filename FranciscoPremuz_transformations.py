@@ -25,18 +25,21 @@ Este TP:
 · Calcula agregados mensuales → GOLD
 """
 
-import os
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from deltalake import write_deltalake, DeltaTable
 import configparser
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = Path(__file__).resolve().parent
 
 # ===========================================================
 # CARGA CONFIGURACIONES DE STORAGE (LOCAL o MINIO)
 # ===========================================================
 config = configparser.ConfigParser()
-config.read(os.path.join(BASE_DIR, "config", "storage.conf"))
+config.read(BASE_DIR / "config" / "storage.conf")
 
 storage_options = None
 bucket_name = None
@@ -53,7 +56,9 @@ if "minio" in config:
         "AWS_SECRET_ACCESS_KEY": secret,
         "AWS_REGION": "us-east-1",
         "AWS_ENDPOINT_URL": endpoint,
-        "AWS_ALLOW_HTTP": "true"
+        "AWS_ALLOW_HTTP": "true",
+        # commits seguros con PUT condicional por ETag, igual que en la ingesta
+        "aws_conditional_put": minio.get("aws_conditional_put", "etag")
     }
     bucket_name = minio["bucket_name"]
 else:
@@ -62,25 +67,26 @@ else:
 # ===========================================================
 # DEFINICIÓN DE RUTAS LOCAL + S3
 # ===========================================================
-BRONZE_LOCAL = os.path.join(BASE_DIR, "data", "bronze", "alphavantage")
-SILVER_LOCAL = os.path.join(BASE_DIR, "data", "silver", "alphavantage")
-GOLD_LOCAL   = os.path.join(BASE_DIR, "data", "gold", "alphavantage")
+# (Path construidos una sola vez)
+BRONZE_LOCAL = BASE_DIR / "data" / "bronze" / "alphavantage"
+SILVER_LOCAL = BASE_DIR / "data" / "silver" / "alphavantage"
+GOLD_LOCAL   = BASE_DIR / "data" / "gold" / "alphavantage"
 
 # Si no hay MinIO, crear carpetas localmente
 if bucket_name is None:
-    os.makedirs(SILVER_LOCAL, exist_ok=True)
-    os.makedirs(GOLD_LOCAL, exist_ok=True)
+    SILVER_LOCAL.mkdir(parents=True, exist_ok=True)
+    GOLD_LOCAL.mkdir(parents=True, exist_ok=True)
 
 # Rutas BRONZE locales
-CRYPTO_BRONZE_PATH_LOCAL = os.path.join(BRONZE_LOCAL, "digital_currency_daily")
-FX_BRONZE_PATH_LOCAL     = os.path.join(BRONZE_LOCAL, "currency_exchange_rate")
+CRYPTO_BRONZE_PATH_LOCAL = BRONZE_LOCAL / "digital_currency_daily"
+FX_BRONZE_PATH_LOCAL     = BRONZE_LOCAL / "currency_exchange_rate"
 
 # Rutas SILVER y GOLD locales
-CRYPTO_SILVER_PATH_LOCAL = os.path.join(SILVER_LOCAL, "crypto_daily_clean")
-FX_SILVER_PATH_LOCAL     = os.path.join(SILVER_LOCAL, "exchange_rate_clean")
+CRYPTO_SILVER_PATH_LOCAL = SILVER_LOCAL / "crypto_daily_clean"
+FX_SILVER_PATH_LOCAL     = SILVER_LOCAL / "exchange_rate_clean"
 
-CRYPTO_GOLD_PATH_LOCAL = os.path.join(GOLD_LOCAL, "crypto_monthly_summary")
-FX_GOLD_PATH_LOCAL     = os.path.join(GOLD_LOCAL, "exchange_rate_latest")
+CRYPTO_GOLD_PATH_LOCAL = GOLD_LOCAL / "crypto_monthly_summary"
+FX_GOLD_PATH_LOCAL     = GOLD_LOCAL / "exchange_rate_latest"
 
 # Rutas S3 si hay MinIO
 CRYPTO_BRONZE_PATH_S3 = f"s3://{bucket_name}/bronze/alphavantage/digital_currency_daily" if bucket_name else None
@@ -93,31 +99,47 @@ CRYPTO_GOLD_PATH_S3 = f"s3://{bucket_name}/gold/alphavantage/crypto_monthly_summ
 FX_GOLD_PATH_S3     = f"s3://{bucket_name}/gold/alphavantage/exchange_rate_latest" if bucket_name else None
 
 
+# Tipos fijos de SILVER crypto: precios en float32 para que las lecturas
+# posteriores (GOLD, análisis) escaneen la mitad de bytes
+CRYPTO_SILVER_TYPES = {
+    "open": pa.float32(),
+    "high": pa.float32(),
+    "low": pa.float32(),
+    "close": pa.float32(),
+    "volume": pa.float32(),
+    "close_fx": pa.float32(),
+}
+
+
 # ===========================================================
 # FUNCIONES AUXILIARES
 # ===========================================================
-def safe_read_delta(local_path, s3_path=None, storage_options=None):
+def safe_read_delta(local_path, s3_path=None, storage_options=None,
+                    columns=None, filters=None):
     """
-    Intenta leer Delta desde MinIO (si está configurado).
-    Si falla, intenta leer desde el almacenamiento local.
+    Lee Delta desde MinIO si está configurado (storage_options),
+    si no, desde el almacenamiento local. Solo se intenta uno de los dos.
+    columns y filters se pasan a la lectura para leer solo las columnas
+    y particiones necesarias.
     """
-    # 1. Intento MinIO
-    if s3_path:
+    # 1. MinIO
+    if storage_options and s3_path:
         try:
             print(f"Intentando leer desde MinIO: {s3_path}")
             dt = DeltaTable(s3_path, storage_options=storage_options)
-            df = dt.to_pandas()
+            df = dt.to_pandas(columns=columns, filters=filters)
             print(f"Leído desde MinIO.")
             return df
         except Exception as e:
             print(f"Falló lectura MinIO: {e}")
+        return None
 
-    # 2. Intento local
+    # 2. Local
     try:
-        if os.path.exists(local_path):
+        if local_path.is_dir():
             print(f"Intentando leer localmente: {local_path}")
             dt = DeltaTable(local_path)
-            df = dt.to_pandas()
+            df = dt.to_pandas(columns=columns, filters=filters)
             print(f"Leído localmente.")
             return df
     except Exception as e:
@@ -126,14 +148,37 @@ def safe_read_delta(local_path, s3_path=None, storage_options=None):
     return None
 
 
+def safe_table_types(local_path, s3_path=None, storage_options=None):
+    """
+    Devuelve los tipos de columna ({nombre: tipo Arrow}) de una tabla
+    Delta existente, eligiendo el backend igual que safe_read_delta.
+    Devuelve {} si la tabla todavía no existe.
+    """
+    try:
+        if storage_options and s3_path:
+            dt = DeltaTable(s3_path, storage_options=storage_options)
+        elif local_path.is_dir():
+            dt = DeltaTable(local_path)
+        else:
+            return {}
+    except Exception:
+        return {}
+    return {field.name: field.type for field in pa.schema(dt.schema().to_arrow())}
+
+
 def write_delta(df, local_path=None, s3_path=None, mode="overwrite",
-                partition_by=None, storage_options=None):
+                partition_by=None, storage_options=None, predicate=None):
     """
-    Escribe una tabla Delta en MinIO si está configurado.
-    Si falla, escribe localmente.
+    Escribe una tabla Delta en MinIO si está configurado (storage_options),
+    si no, en el almacenamiento local; el mismo backend que lee
+    safe_read_delta. Si falla la escritura en MinIO se corta la ejecución:
+    una copia local no la leería la próxima corrida.
+    Con mode="overwrite" y un predicate, solo se reemplazan las filas
+    que cumplen el predicado.
     """
 
-    df = df.reset_index(drop=True)
+    if isinstance(df, pd.DataFrame):
+        df = df.reset_index(drop=True)
 
     # Intento escribir en MinIO
     if s3_path and storage_options:
@@ -144,30 +189,87 @@ def write_delta(df, local_path=None, s3_path=None, mode="overwrite",
                 df,
                 mode=mode,
                 partition_by=partition_by,
-                storage_options=storage_options
+                storage_options=storage_options,
+                predicate=predicate
             )
             print(f"Delta escrito en MinIO.")
             return
         except Exception as e:
             print(f"No se pudo escribir en MinIO: {e}")
+            raise
 
-    # Fallback → escritura local
+    # Sin MinIO → escritura local
     if local_path:
-        os.makedirs(local_path, exist_ok=True)
+        local_path.mkdir(parents=True, exist_ok=True)
         try:
             print(f"Escribiendo localmente: {local_path}")
-            write_deltalake(local_path, df, mode=mode, partition_by=partition_by)
+            write_deltalake(local_path, df, mode=mode, partition_by=partition_by,
+                            predicate=predicate)
             print(f"Delta escrito localmente.")
         except Exception as e:
             print(f"Falló escritura local: {e}")
 
 
+def with_types(df, types):
+    """
+    Convierte un DataFrame a tabla Arrow fijando el tipo de las columnas
+    indicadas en types. El resto de las columnas se infiere como siempre.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = pa.schema([pa.field(f.name, types.get(f.name, f.type)) for f in table.schema])
+    return table.cast(schema)
+
+
+def clean_column_names(cols):
+    """
+    Limpia nombres de columnas de un Index (sin espacios alrededor,
+    minúsculas, espacios internos como _). No quita el prefijo numérico
+    ni deduplica: para eso está normalize_columns en pipeline_utils.
+    """
+    return cols.str.strip().str.lower().str.replace(" ", "_")
+
+
+def fill_missing(values):
+    """
+    Rellena NaN hacia adelante y luego hacia atrás (equivalente a
+    ffill().bfill()) sobre un array 2D de numpy, propagando índices con
+    maximum/minimum.accumulate en vez de copiar el DataFrame en cada paso.
+    """
+    n_rows, n_cols = values.shape
+    if n_rows == 0:
+        return values
+    rows = np.arange(n_rows)[:, None]
+    cols = np.arange(n_cols)
+
+    # forward fill: cada fila toma el último índice válido hasta ella
+    last_valid = np.where(~np.isnan(values), rows, 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    values = values[last_valid, cols]
+
+    # backward fill: los NaN que quedan al comienzo toman el siguiente índice válido
+    next_valid = np.where(~np.isnan(values), rows, n_rows - 1)
+    next_valid = np.minimum.accumulate(next_valid[::-1], axis=0)[::-1]
+    return values[next_valid, cols]
+
+
 # ===========================================================
 # LECTURA DESDE BRONZE
 # ===========================================================
 print("Inicio del procesamiento (Bronze → Silver → Gold)\n")
 
-df_crypto = safe_read_delta(CRYPTO_BRONZE_PATH_LOCAL, CRYPTO_BRONZE_PATH_S3, storage_options)
+# procesamiento incremental: se busca la última fecha ya procesada en SILVER
+# (solo la columna datetime) para leer de BRONZE únicamente las particiones nuevas
+df_silver_prev = safe_read_delta(CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3, storage_options,
+                                 columns=["datetime"])
+
+max_dt = None
+crypto_filters = None
+if df_silver_prev is not None and not df_silver_prev.empty:
+    max_dt = df_silver_prev["datetime"].max()
+    crypto_filters = [("date", ">", str(max_dt.date()))]
+
+df_crypto = safe_read_delta(CRYPTO_BRONZE_PATH_LOCAL, CRYPTO_BRONZE_PATH_S3, storage_options,
+                            filters=crypto_filters)
 df_fx     = safe_read_delta(FX_BRONZE_PATH_LOCAL, FX_BRONZE_PATH_S3, storage_options)
 
 if df_crypto is None:
@@ -184,20 +286,17 @@ print(df_crypto.head())
 # ===========================================================
 print("\nConstruyendo SILVER para crypto...")
 
-df = df_crypto.copy()
+# to_pandas() ya devuelve un frame propio: se trabaja sobre él sin copiarlo
+df = df_crypto
 
-# procesamiento incremental
-df_silver_prev = safe_read_delta(CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3, storage_options)
-
-if df_silver_prev is not None:
-    max_dt = df_silver_prev["datetime"].max()
+if max_dt is not None:
     print(f"Procesando incrementalmente desde {max_dt}...")
     df = df[df["datetime"] > max_dt]
 else:
     print("Carga inicial: Se procesará toda la historia de Bronze.")
 
 # Normaliza nombres de columnas
-df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+df.columns = clean_column_names(df.columns)
 
 # columna datetime a tipo fecha
 df["datetime"] = pd.to_datetime(df["datetime"], errors="coerce")
@@ -213,18 +312,17 @@ df = df.drop_duplicates(subset=["datetime"], keep="last").sort_values("datetime"
 # elimina filas sin fecha valida
 df = df.dropna(subset=["datetime"])
 
-# relleno valores faltantes
-df[num_cols] = df[num_cols].ffill().bfill()
-
-# Elimina precios inválidos (close <= 0)")
-df = df[df["close"] > 0]
+# relleno valores faltantes (una pasada sobre el array numpy)
+df[num_cols] = fill_missing(df[num_cols].to_numpy(dtype="float64"))
 
-# crea columnas date y month
-df["date"] = df["datetime"].dt.date.astype(str)
-df["month"] = df["datetime"].dt.to_period("M").astype(str)
+# Elimina precios inválidos (close <= 0) con una sola máscara
+# (los duplicados por datetime ya se eliminaron arriba)
+df = df.loc[df["close"].to_numpy() > 0].copy()
 
-# Control de duplicados antes de escribir (incremental append seguro)
-df = df.drop_duplicates(subset=["datetime"], keep="last")
+# crea columnas date y month truncando el datetime64 con numpy (sin objetos date/Period por fila)
+dt_values = df["datetime"].to_numpy()
+df["date"] = dt_values.astype("datetime64[D]").astype(str)
+df["month"] = dt_values.astype("datetime64[M]").astype(str)
 
 # ===========================================================
 # ENRIQUECIMIENTO FX 
@@ -234,18 +332,12 @@ print("\nProcesando tasa FX para enriquecer precios...")
 fx_value = None
 if df_fx is not None:
     fx = df_fx.copy()
-    fx.columns = [c.strip().lower().replace(" ", "_") for c in fx.columns]
+    fx.columns = clean_column_names(fx.columns)
 
-    # Busca columna numérica que represente el tipo de cambio
-    candidates = [c for c in fx.columns if "rate" in c or "exchange" in c]
-    numeric_candidates = []
-
-    for c in candidates:
-        numeric_candidates.append(pd.to_numeric(fx[c], errors="coerce"))
-
-    if numeric_candidates:
-        fx_value = numeric_candidates[0].dropna().iloc[-1]
-        df["close_fx"] = df["close"] * fx_value
+    # después de normalizar nombres, el tipo de cambio está siempre en "exchange_rate"
+    if "exchange_rate" in fx.columns:
+        fx_value = float(fx["exchange_rate"].iloc[-1])
+        df["close_fx"] = df["close"].to_numpy() * fx_value
         print(f"Tasa FX aplicada. Valor: {fx_value}")
     else:
         print("No se encontró columna FX válida.")
@@ -254,23 +346,30 @@ if df_fx is not None:
 # ===========================================================
 # GUARDAR SILVER – crypto
 # ===========================================================
-write_delta(df, CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3,
-            partition_by=["date"], mode="append", storage_options=storage_options)
+# en una SILVER existente mandan sus tipos (p. ej. float64 en tablas previas): así las filas nuevas
+# no quedan como float32 ensanchado junto a las anteriores; las columnas nuevas usan CRYPTO_SILVER_TYPES
+silver_types = {**CRYPTO_SILVER_TYPES, **safe_table_types(CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3, storage_options)}
+silver_crypto_table = with_types(df, silver_types)
 
-print("\n--- SILVER (crypto) ---")
-print(df.head())
-print(f"Filas Silver Crypto: {len(df)}")
+
+def build_silver_crypto():
+    write_delta(silver_crypto_table, CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3,
+                partition_by=["date"], mode="append", storage_options=storage_options)
 
 
 # ===========================================================
 # SILVER – FX LIMPIO
 # ===========================================================
-df_fx_s = None
-if df_fx is not None:
-    print("\nConstruyendo SILVER para FX...")
+def build_silver_fx():
+    """
+    Limpia el FX de BRONZE y lo agrega a SILVER. Devuelve la tabla
+    limpia y su última fila (la tasa vigente para GOLD).
+    """
+    if df_fx is None:
+        return None, None
 
     df_fx_s = df_fx.copy()
-    df_fx_s.columns = [c.strip().lower().replace(" ", "_") for c in df_fx_s.columns]
+    df_fx_s.columns = clean_column_names(df_fx_s.columns)
 
     # elimina duplicados por fecha FX
     if "last_refreshed" in df_fx_s.columns:
@@ -280,6 +379,25 @@ if df_fx is not None:
 
     write_delta(df_fx_s, FX_SILVER_PATH_LOCAL, FX_SILVER_PATH_S3, mode="append", storage_options=storage_options)
 
+    # la última tasa se toma acá, sin volver a leer SILVER para el GOLD
+    return df_fx_s, df_fx_s.iloc[[-1]]
+
+
+# Las dos SILVER son independientes y casi todo su tiempo es I/O de deltalake
+# (Rust, fuera del GIL): se escriben en paralelo
+print("\nConstruyendo SILVER para crypto y FX...")
+
+with ThreadPoolExecutor(max_workers=2) as executor:
+    silver_crypto = executor.submit(build_silver_crypto)
+    silver_fx = executor.submit(build_silver_fx)
+    silver_crypto.result()
+    df_fx_s, df_fx_gold = silver_fx.result()
+
+print("\n--- SILVER (crypto) ---")
+print(df.head())
+print(f"Filas Silver Crypto: {len(df)}")
+
+if df_fx_s is not None:
     print("\n--- SILVER (fx) ---")
     print(df_fx_s.head())
 
@@ -287,40 +405,81 @@ if df_fx is not None:
 # ===========================================================
 # GOLD – Resumen mensual crypto
 # ===========================================================
-print("\nConstruyendo GOLD mensual para crypto...")
-
-df_silver_crypto = safe_read_delta(CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3, storage_options)
-
-df_gold_crypto = df_silver_crypto.groupby("month", as_index=False).agg(
-    avg_close=("close", "mean"),
-    max_close=("close", "max"),
-    min_close=("close", "min")
-)
-
-# Evita duplicados por mes en append
-df_gold_crypto = df_gold_crypto.drop_duplicates(subset=["month"], keep="last")
-
-write_delta(df_gold_crypto, CRYPTO_GOLD_PATH_LOCAL, CRYPTO_GOLD_PATH_S3, mode="append", storage_options=storage_options)
+def build_gold_crypto():
+    """
+    Recalcula el resumen mensual de los meses con datos nuevos y los
+    reemplaza en GOLD. Devuelve la tabla escrita o None si no hubo cambios.
+    """
+    if df.empty:
+        return None
 
-print("\n--- GOLD (crypto mensual) ---")
-print(df_gold_crypto)
+    if max_dt is None:
+        # carga inicial: silver_crypto_table ya tiene toda la historia de SILVER (con los tipos escritos),
+        # no hace falta releerla
+        silver_month_close = silver_crypto_table.select(["month", "close"])
+    else:
+        # incremental: solo se recalculan los meses con datos nuevos,
+        # leyendo de SILVER únicamente esas particiones y columnas
+        first_day = f"{df['month'].min()}-01"
+        df_silver_crypto = safe_read_delta(CRYPTO_SILVER_PATH_LOCAL, CRYPTO_SILVER_PATH_S3, storage_options,
+                                           columns=["month", "close"], filters=[("date", ">=", first_day)])
+        if df_silver_crypto is None:
+            return None
+        silver_month_close = pa.Table.from_pandas(df_silver_crypto[["month", "close"]], preserve_index=False)
+
+    # agregación con los kernels de Arrow (hash aggregate en C++) en lugar de pandas groupby
+    df_gold_crypto = (
+        silver_month_close
+        .group_by("month")
+        .aggregate([("close", "mean"), ("close", "max"), ("close", "min")])
+        .select(["month", "close_mean", "close_max", "close_min"])
+        .rename_columns(["month", "avg_close", "max_close", "min_close"])
+        .sort_by("month")
+    )
+    # mean siempre devuelve float64: avg_close toma el tipo de close como max/min (GOLD de un solo tipo)
+    close_type = silver_month_close["close"].type
+    df_gold_crypto = df_gold_crypto.set_column(1, "avg_close", df_gold_crypto["avg_close"].cast(close_type))
+
+    if max_dt is None:
+        # carga inicial: df_gold_crypto tiene todos los meses, se reemplaza GOLD completo sin predicado
+        predicate = None
+    else:
+        # Reemplaza solo los meses recalculados (evita duplicados por mes)
+        months = ",".join(f"'{m}'" for m in df_gold_crypto["month"].to_pylist())
+        predicate = f"month IN ({months})"
+    write_delta(df_gold_crypto, CRYPTO_GOLD_PATH_LOCAL, CRYPTO_GOLD_PATH_S3, mode="overwrite",
+                predicate=predicate, storage_options=storage_options)
+    return df_gold_crypto
 
 
 # ===========================================================
 # GOLD – Último valor FX
 # ===========================================================
-print("\nConstruyendo GOLD para FX (último valor)...")
+def build_gold_fx():
+    if df_fx_gold is None:
+        return
+    # GOLD guarda un único valor vigente: se reemplaza en cada ejecución
+    write_delta(df_fx_gold, FX_GOLD_PATH_LOCAL, FX_GOLD_PATH_S3, mode="overwrite", storage_options=storage_options)
 
-if df_fx_s is not None:
-    df_fx_gold = df_fx_s.tail(1)
 
-    # Asegura que no se duplique la última tasa en el append
-    df_fx_gold = df_fx_gold.drop_duplicates()
+# los dos GOLD tampoco dependen entre sí: mismo esquema que en SILVER
+print("\nConstruyendo GOLD mensual para crypto y GOLD para FX (último valor)...")
+
+with ThreadPoolExecutor(max_workers=2) as executor:
+    gold_crypto = executor.submit(build_gold_crypto)
+    gold_fx = executor.submit(build_gold_fx)
+    df_gold_crypto = gold_crypto.result()
+    gold_fx.result()
 
-    write_delta(df_fx_gold, FX_GOLD_PATH_LOCAL, FX_GOLD_PATH_S3, mode="append", storage_options=storage_options)
+if df_gold_crypto is None:
+    print("No hay datos nuevos en SILVER, GOLD no cambia.")
+else:
+    print("\n--- GOLD (crypto mensual) ---")
+    print(df_gold_crypto.to_pandas())
 
+if df_fx_gold is not None:
     print("\n--- GOLD (fx último valor) ---")
     print(df_fx_gold)
 
 
-print("\n=== Procesamiento completado ===")
\ No newline at end of file
+print("\n=== Procesamiento completado ===")
@@ -34,30 +34,28 @@ Decisiones del diseño:
 
 import os
 import requests
-import pandas as pd
+import orjson
 import pyarrow as pa
-import configparser
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from deltalake import write_deltalake, DeltaTable
-from deltalake.exceptions import TableNotFoundError
-from deltalake.table import TableOptimizer
+from pipeline_utils import (
+    CRYPTO_PRICE_TYPES, MAX_REPLACE_PARTITIONS, create_session, get_storage_options, load_config_file,
+    cast_columns, normalize_columns, save_data_as_delta, upsert_data_as_delta
+)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# sesión HTTP compartida entre llamadas a la API
+SESSION = create_session()
+
+# columnas de la tabla BRONZE de crypto (las que se leen para SILVER)
+CRYPTO_COLUMNS = ["datetime", "open", "high", "low", "close", "volume", "date"]
+
 # -----------------------------------------------------------------------
 # funciones auxiliares
 
-# config
-def load_config_file(filename):
-    # Carga un archivo .conf desde la carpeta config/
-    config_path = os.path.join(BASE_DIR, "config", filename)
-    if not os.path.exists(config_path):
-        print(f"No se encontró {config_path}.")
-        return None
-    parser = configparser.ConfigParser()
-    parser.read(config_path)
-    return parser
-
 def s3_join(*parts):
     return "/".join([p.strip("/") for p in parts])
 
@@ -65,12 +63,12 @@ def s3_join(*parts):
 def get_data(base_url, params=None, headers=None):
     # http a la API y devuelve datos en formato JSON
     try:
-        response = requests.get(base_url, params=params, headers=headers)
+        response = SESSION.get(base_url, params=params, headers=headers, timeout=(5, 30))
         response.raise_for_status()
         try:
-            data = response.json()
+            data = orjson.loads(response.content)
             return data
-        except Exception as e:
+        except orjson.JSONDecodeError as e:
             print("La respuesta no es JSON:", e)
             return None
     except requests.exceptions.RequestException as e:
@@ -79,8 +77,18 @@ def get_data(base_url, params=None, headers=None):
     
 # transform
 
+def to_float(values):
+    # equivalente a pd.to_numeric(errors="coerce"): tolera espacios alrededor y acepta inf/infinity/nan
+    # (sin distinguir mayúsculas); lo que no es numérico queda como null
+    values = pc.utf8_trim_whitespace(pa.array(values, pa.string()))
+    is_number = pc.match_substring_regex(
+        values, r"^[-+]?((\d+\.?\d*|\.\d+)([eE][-+]?\d+)?|inf|infinity|nan)$", ignore_case=True
+    )
+    # precisión completa: el tipo final lo decide la tabla destino (upsert_data_as_delta)
+    return pc.if_else(is_number, values, pa.scalar(None, pa.string())).cast(pa.float64())
+
 def build_dynamic_table(data):
-    # convierte las cotizaciones en un dataframe limpio
+    # convierte las cotizaciones en una tabla Arrow limpia (columnar, sin pasar por pandas)
     if not data:
         return None
     
@@ -91,25 +99,35 @@ def build_dynamic_table(data):
         print(list(data.keys()))
         return None
     
-    df = pd.DataFrame.from_dict(data[series_key], orient="index")
-    df.columns = [c.split(". ")[-1].split(" (")[0] for c in df.columns]
+    series = data[series_key]
+    if not series:
+        print("La serie temporal está vacía.")
+        return None
+
+    # "1. open" -> "open"
+    keys = list(next(iter(series.values())).keys())
+    names = [k.split(". ")[-1].split(" (")[0] for k in keys]
 
-    df.index.name = "datetime"
-    df.reset_index(inplace=True)
-    df["datetime"] = pd.to_datetime(df["datetime"], format="%Y-%m-%d", errors="coerce")
-    df.sort_values(by="datetime", inplace=True)
+    # una sola pasada sobre el JSON armando una lista por columna
+    dates = []
+    values = [[] for _ in keys]
+    for day, row in series.items():
+        dates.append(day)
+        for column, key in zip(values, keys):
+            column.append(row.get(key))
 
-    for col in df.columns:
-        if col != "datetime":
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+    dates = pa.array(dates, pa.string())
+    columns = {"datetime": pc.strptime(dates, format="%Y-%m-%d", unit="us", error_is_null=True)}
+    for name, column in zip(names, values):
+        columns[name] = to_float(column)
 
-    # particion por fecha
-    df["date"] = df["datetime"].dt.date.astype(str)
+    # particion por fecha (las claves de la API ya vienen como YYYY-MM-DD)
+    columns["date"] = dates
 
-    return df
+    return pa.table(columns).sort_by("datetime")
 
 def build_static_table(data):
-    # convierte datos estaticos en dataframe
+    # convierte datos estaticos en una tabla Arrow de una fila
     if not data:
         return None
     
@@ -119,74 +137,12 @@ def build_static_table(data):
         print("No se encontró 'Realtime Currency Exchange Rate' en la respuesta.")
         return None
 
-    # Convierte en DataFrame
-    df = pd.DataFrame([rate])
-
     # Normaliza nombres de columnas automáticamente (sino el codigo falla porque aparecen nombres duplicados)
-    new_columns = []
-    seen = set()
+    names = normalize_columns(rate.keys())
 
-    for c in df.columns:
-        parts = c.split(" ")[1:]  # remueve el número y punto
-        col_name = "_".join(parts).lower()  # une con _
-        
-        # Si el nombre ya existe, agrega un sufijo numérico
-        base_name = col_name
-        counter = 1
-        while col_name in seen:
-            col_name = f"{base_name}_{counter}"
-            counter += 1
-
-        seen.add(col_name)
-        new_columns.append(col_name)
-
-    df.columns = new_columns
-    return df
-
-def remove_duplicate_columns(df):
-    # Elimina columnas duplicadas automáticamente
-    seen = set()
-    new_cols = []
-    for c in df.columns:
-        if c not in seen:
-            new_cols.append(c)
-            seen.add(c)
-        else:
-            new_cols.append(f"{c}_dup")
-    df.columns = new_cols
-    return df
-
-# write (delta)
-def save_data_as_delta(df, path, storage_options=None, mode="overwrite", partition_cols=None):  
-    # guarda los datos en formato delta lake 
-    write_deltalake(
-        path,
-        df,
-        mode=mode,
-        storage_options=storage_options,
-        partition_by=partition_cols
-    )
-
-def upsert_data_as_delta(data, data_path, predicate, storage_options=None, partition_cols=None):
-    # inserta nuevos datos o actualiza registros existentes
-    if data is None:
-        print("upsert: No hay datos para escribir.")
-        return
-    
-    try:
-        dt = DeltaTable(data_path, storage_options=storage_options)
-        data_pa = pa.Table.from_pandas(data)
-        dt.merge(
-            source=data_pa,
-            source_alias="source",
-            target_alias="target",
-            predicate=predicate
-        ) \
-        .when_matched_update_all() \
-        .when_not_matched_insert_all() \
-        .execute()
-    except TableNotFoundError:
-        save_data_as_delta(data, data_path, storage_options, "overwrite", partition_cols)
+    # una sola fila: tabla Arrow directa, sin pasar por un DataFrame de pandas
+    # (from_arrays conserva todas las columnas, un dict descartaría las repetidas)
+    return pa.Table.from_arrays([pa.array([value], pa.string()) for value in rate.values()], names=names)
 
 # -----------------------------------------------------------------------
 # funcion principal
@@ -220,21 +176,11 @@ if __name__ == "__main__":
     # sino, el data lake se crea de manera local 
 
     # cargar configuracion de almacenamiento (minio o local)
-    storage_config = load_config_file("storage.conf")
-    storage_options = None
+    storage_options = get_storage_options()
 
-    if storage_config and "minio" in storage_config:
+    if storage_options is not None:
         print("Usando almacenamiento en MinIO\n")
-        minio = storage_config["minio"]
-        storage_options = {
-            "AWS_ENDPOINT_URL": minio["AWS_ENDPOINT_URL"],
-            "AWS_ACCESS_KEY_ID": minio["AWS_ACCESS_KEY_ID"],
-            "AWS_SECRET_ACCESS_KEY": minio["AWS_SECRET_ACCESS_KEY"],
-            "AWS_ALLOW_HTTP": minio["AWS_ALLOW_HTTP"],
-            "aws_conditional_put": minio["aws_conditional_put"],
-            "AWS_S3_ALLOW_UNSAFE_RENAME": minio["AWS_S3_ALLOW_UNSAFE_RENAME"]
-        }
-        bucket_name = minio["bucket_name"]
+        bucket_name = load_config_file("storage.conf")["minio"]["bucket_name"]
         bronze_root = f"s3://{bucket_name}/bronze/alphavantage"
         silver_root = f"s3://{bucket_name}/silver/alphavantage"
         gold_root   = f"s3://{bucket_name}/gold/alphavantage"
@@ -249,7 +195,6 @@ if __name__ == "__main__":
 
     # CAPA BRONZE - Endpoint dinámico - cotización cripto diaria - incremental: cada día se agrega un nuevo registro
     print("Capa BRONZE\n")
-    print("Extracción dinámica: Precio diario de Bitcoin (BTC/USD)\n")
 
     params_dynamic = {
         "function": "DIGITAL_CURRENCY_DAILY",
@@ -258,47 +203,68 @@ if __name__ == "__main__":
         "apikey": api_key
     }
 
-    data_dynamic = get_data(base_url, params=params_dynamic)
+    # CAPA BRONZE - Endpoint estático - cotización actual - extracción full overwrite: un solo valor que se reemplaza en cada ejecución
+    params_static = {
+        "function": "CURRENCY_EXCHANGE_RATE",
+        "from_currency": "USD",
+        "to_currency": "EUR",
+        "apikey": api_key
+    }
+
+    # las dos llamadas son independientes: se hacen en paralelo y el tiempo total es el de la más lenta
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_dynamic = executor.submit(get_data, base_url, params=params_dynamic)
+        future_static = executor.submit(get_data, base_url, params=params_static)
+        data_dynamic = future_dynamic.result()
+        data_static = future_static.result()
+
+    print("Extracción dinámica: Precio diario de Bitcoin (BTC/USD)\n")
+
+    dt_crypto_bronze = None  # se reutiliza en SILVER si el upsert ya abrió la tabla
+    crypto_bronze = None     # contenido de BRONZE en memoria, solo si la tabla se acaba de crear
+
     if data_dynamic:
         df_dynamic = build_dynamic_table(data_dynamic)
         if df_dynamic is None:
             print("Transformación dinámica devolvió None, saliendo de la etapa BRONZE dinámico.")
         else:
-            print(df_dynamic.head(), "\n")
+            print(df_dynamic.slice(0, 5).to_pandas(), "\n")
 
             data_path_dynamic = s3_join(bronze_root, "crypto_daily")
 
-            upsert_data_as_delta(
+            dt_crypto_bronze = upsert_data_as_delta(
                 df_dynamic,
                 data_path_dynamic,
-                predicate="target.datetime = source.datetime",
+                predicate="target.date = source.date AND target.datetime = source.datetime",
                 storage_options=storage_options,
-                partition_cols=["date"]
+                partition_cols=["date"],
+                partition_values=sorted(df_dynamic["date"].unique().to_pylist()),
+                since_col="datetime",
+                # una fila por día: cada particion date llega completa
+                max_replace_partitions=MAX_REPLACE_PARTITIONS,
+                types=CRYPTO_PRICE_TYPES
             )
 
+            # solo si la tabla se acaba de crear BRONZE es exactamente df_dynamic y SILVER se arma desde memoria;
+            # en una carga incremental las filas anteriores al último datetime no se reescriben, así que
+            # igual cantidad de filas no garantiza igual contenido: SILVER se lee de BRONZE
+            if dt_crypto_bronze is None:
+                crypto_bronze = cast_columns(df_dynamic, CRYPTO_PRICE_TYPES)  # los mismos tipos que se escribieron
+
             print("Datos dinámicos guardados.\n")
             print("=" * 60)
     else:
         print("No se obtuvieron datos dinámicos de la API.")
         
-    # CAPA BRONZE - Endpoint estático - cotización actual - extracción full overwrite: un solo valor que se reemplaza en cada ejecución
     print("Extracción estática: Cotización actual USD/EUR\n")
 
-    params_static = {
-        "function": "CURRENCY_EXCHANGE_RATE",
-        "from_currency": "USD",
-        "to_currency": "EUR",
-        "apikey": api_key
-    }
-
-    data_static = get_data(base_url, params=params_static)
+    df_static = None
     if data_static:
         df_static = build_static_table(data_static)
         if df_static is None:
             print("Transformación estática devolvió None, saliendo.")
         else:
-            df_static = remove_duplicate_columns(df_static)
-            print(df_static.head())   
+            print(df_static.to_pandas())
 
             data_path_static = s3_join(bronze_root, "exchange_rate")
             save_data_as_delta(df_static, data_path_static, storage_options, mode="overwrite")
@@ -315,29 +281,37 @@ if __name__ == "__main__":
     # Limpieza de cripto
     silver_crypto_path = s3_join(silver_root, "crypto_daily_clean")
     try:
-        dt_crypto_bronze = DeltaTable(s3_join(bronze_root, "crypto_daily"), storage_options=storage_options)
-        df_crypto_bronze = dt_crypto_bronze.to_pandas()
-        df_crypto_silver = df_crypto_bronze.dropna() #remuevo filas vacias
-        df_crypto_silver = df_crypto_silver[df_crypto_silver["close"] > 0] #constraint
+        if crypto_bronze is None:
+            if dt_crypto_bronze is None:
+                dt_crypto_bronze = DeltaTable(s3_join(bronze_root, "crypto_daily"), storage_options=storage_options)
+            # solo las columnas que usa SILVER (deja afuera columnas heredadas como el índice de pandas)
+            crypto_bronze = dt_crypto_bronze.to_pyarrow_table(columns=CRYPTO_COLUMNS)
+        # filtros con kernels de Arrow, sin pasar por pandas
+        crypto_silver = crypto_bronze.drop_null() #remuevo filas vacias
+        crypto_silver = crypto_silver.filter(pc.greater(crypto_silver["close"], 0)) #constraint
 
         write_deltalake(
             silver_crypto_path,
-            df_crypto_silver,
+            crypto_silver,
             mode="overwrite",
             schema_mode="merge",
             storage_options=storage_options,
             partition_by=["date"]
         )
         print("Tabla SILVER (crypto) creada exitosamente.\n")
-        print(df_crypto_silver.head(), "\n")
+        print(crypto_silver.slice(0, 5).to_pandas(), "\n")
     except Exception as e:
         print("Error creando tabla Silver de crypto:", e)
 
     # Limpieza de tipo de cambio
     silver_fx_path = s3_join(silver_root, "exchange_rate_clean")
     try:
-        dt_fx_bronze = DeltaTable(s3_join(bronze_root, "exchange_rate"), storage_options=storage_options)
-        df_fx_bronze = dt_fx_bronze.to_pandas()
+        if df_static is not None:
+            # BRONZE de FX es un overwrite completo de df_static: no hace falta releerlo
+            df_fx_bronze = df_static.to_pandas()
+        else:
+            dt_fx_bronze = DeltaTable(s3_join(bronze_root, "exchange_rate"), storage_options=storage_options)
+            df_fx_bronze = dt_fx_bronze.to_pandas()
         df_fx_silver = df_fx_bronze.loc[:, ~df_fx_bronze.columns.duplicated()]
 
         write_deltalake(
@@ -357,30 +331,39 @@ if __name__ == "__main__":
 
     gold_crypto_path = s3_join(gold_root, "crypto_monthly_summary")
     try:
-        df_crypto_silver["month"] = pd.to_datetime(df_crypto_silver["date"]).dt.to_period("M").astype(str)
-        df_crypto_gold = (
-            df_crypto_silver.groupby("month", as_index=False)
-            .agg(avg_close=("close", "mean"), max_close=("close", "max"), min_close=("close", "min"))
+        # month = "YYYY-MM" directo del string de date, y agregación con group_by de Arrow
+        crypto_gold = (
+            pa.table({"month": pc.utf8_slice_codeunits(crypto_silver["date"], 0, 7), "close": crypto_silver["close"]})
+            .group_by("month")
+            .aggregate([("close", "mean"), ("close", "max"), ("close", "min")])
+            .select(["month", "close_mean", "close_max", "close_min"])
+            .rename_columns(["month", "avg_close", "max_close", "min_close"])
+            .sort_by("month")
         )
+        # mean siempre devuelve float64: avg_close toma el tipo de close como max/min (GOLD de un solo tipo)
+        crypto_gold = crypto_gold.set_column(1, "avg_close", crypto_gold["avg_close"].cast(crypto_silver["close"].type))
 
         write_deltalake(
             gold_crypto_path,
-            df_crypto_gold,
+            crypto_gold,
             mode="overwrite",
             schema_mode="merge",
             storage_options=storage_options
         )
         print("Tabla GOLD (resumen mensual de crypto) creada exitosamente.\n")
-        print(df_crypto_gold.head(), "\n")
+        print(crypto_gold.slice(0, 5).to_pandas(), "\n")
     except Exception as e:
         print("Error creando tabla Gold de crypto:", e)
 
     gold_fx_path = s3_join(gold_root, "exchange_rate_latest")
     try:
-        df_fx_gold = df_fx_silver.sort_values(by="last_refreshed", ascending=False).head(1)
+        # la cotización más reciente en una sola pasada (argmax) en lugar de ordenar toda la tabla
+        latest = df_fx_silver["last_refreshed"].astype("datetime64[ns]").to_numpy().argmax()
+        df_fx_gold = df_fx_silver.iloc[[latest]]
         write_deltalake(
             gold_fx_path,
-            df_fx_gold,
+            # iloc deja un índice no secuencial: sin preserve_index=False se escribiría como columna
+            pa.Table.from_pandas(df_fx_gold, preserve_index=False),
             mode="overwrite",
             schema_mode="merge",
             storage_options=storage_options
@@ -0,0 +1,27 @@
+from deltalake import DeltaTable
+from datetime import datetime
+from maintenance_utils import find_delta_tables
+
+DATA_LAKE_ROOT = "./data"
+
+def show_history(limit=3):
+    """
+    Muestra los últimos commits de cada tabla Delta del data lake.
+    Leer el historial recorre los JSON de _delta_log: por eso vive acá y no en la ingesta.
+    """
+    for table_path in sorted(find_delta_tables(DATA_LAKE_ROOT)):
+        print(f"HISTORY: {table_path}")
+
+        try:
+            dt = DeltaTable(table_path)
+            print(f"Versión actual: {dt.version()}")
+            for commit in dt.history(limit):
+                # timestamp del commit en milisegundos epoch
+                timestamp = datetime.fromtimestamp(commit["timestamp"] / 1000)
+                print(f"  v{commit.get('version')} {timestamp:%Y-%m-%d %H:%M:%S} {commit.get('operation')}")
+        except Exception as e:
+            print(f"ERROR reading history of {table_path}: {e}")
+
+
+if __name__ == "__main__":
+    show_history()
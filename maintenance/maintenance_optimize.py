@@ -1,26 +1,55 @@
-from deltalake import optimize
-import os
+from deltalake import DeltaTable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from maintenance_utils import find_delta_tables
 
 # Directorio raíz del data lake
 DATA_LAKE_ROOT = "./data"
 
+# Máximo de tablas procesadas en paralelo (el trabajo es I/O y corre en Rust, sin el GIL)
+MAX_WORKERS = 8
+
+# Tamaño objetivo de los Parquet compactados (128 MB)
+TARGET_FILE_SIZE = 128 * 1024 * 1024
+
+# En tablas particionadas por fecha solo se compactan las particiones recientes;
+# las históricas ya quedaron compactadas en corridas anteriores y no se reescriben
+RECENT_DAYS = 30
+
+def optimize_table(table_path):
+    """
+    Compacta una tabla Delta; los errores se informan sin cortar el resto de las tablas.
+    """
+    print(f"OPTIMIZING: {table_path}")
+
+    try:
+        dt = DeltaTable(table_path)
+        partition_filters = None
+        if "date" in dt.metadata().partition_columns:
+            # las particiones "date" son strings ISO (YYYY-MM-DD): el orden lexicográfico es el cronológico
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=RECENT_DAYS)).date().isoformat()
+            partition_filters = [("date", ">=", cutoff)]
+
+        metrics = dt.optimize.compact(partition_filters=partition_filters, target_size=TARGET_FILE_SIZE)
+        print(f"SUCCESS: optimized {table_path} "
+              f"({metrics['numFilesRemoved']} archivos compactados en {metrics['numFilesAdded']})")
+    except Exception as e:
+        print(f"ERROR optimizing {table_path}: {e}")
+
+
 def optimize_tables():
     """
     Ejecuta OPTIMIZE sobre todas las tablas Delta en el data lake.
     OPTIMIZE compacta archivos pequeños en menos archivos grandes (Parquet).
     Mejora performance de lectura / scans.
     """
-    for root, dirs, files in os.walk(DATA_LAKE_ROOT):
-        if "_delta_log" in dirs:  # indica que es una tabla Delta
-            table_path = root
-            print(f"OPTIMIZING: {table_path}")
+    table_paths = list(find_delta_tables(DATA_LAKE_ROOT))
+    if not table_paths:
+        return
 
-            try:
-                optimize(table_path)
-                print(f"SUCCESS: optimized {table_path}")
-            except Exception as e:
-                print(f"ERROR optimizing {table_path}: {e}")
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(table_paths))) as executor:
+        list(executor.map(optimize_table, table_paths))
 
 
 if __name__ == "__main__":
-    optimize_tables()
\ No newline at end of file
+    optimize_tables()
@@ -0,0 +1,31 @@
+"""
+Funciones auxiliares compartidas por los scripts de maintenance/.
+"""
+
+import os
+
+
+def find_delta_tables(root):
+    """
+    Devuelve las rutas de las tablas Delta bajo root.
+    Recorre con os.scandir y no desciende dentro de una tabla (ni _delta_log ni particiones).
+    """
+    if not os.path.isdir(root):  # como os.walk: sin data lake no hay tablas
+        return
+
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        subdirs = []
+        is_table = False
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name == "_delta_log":  # indica que es una tabla Delta
+                        is_table = True
+                    else:
+                        subdirs.append(entry.path)
+        if is_table:
+            yield directory
+        else:
+            stack.extend(subdirs)
@@ -1,25 +1,41 @@
-from deltalake import vacuum
-import os
+from deltalake import DeltaTable
+from concurrent.futures import ThreadPoolExecutor
+from maintenance_utils import find_delta_tables
 
 DATA_LAKE_ROOT = "./data"
 
+# Máximo de tablas procesadas en paralelo (el trabajo es I/O y corre en Rust, sin el GIL)
+MAX_WORKERS = 8
+
+def vacuum_table(table_path, retention_hours=168):
+    """
+    Ejecuta VACUUM sobre una tabla Delta; los errores se informan sin cortar el resto de las tablas.
+    """
+    print(f"VACUUM: {table_path}")
+
+    try:
+        # dry_run=False: por defecto delta-rs solo lista los archivos que borraría
+        removed = DeltaTable(table_path).vacuum(
+            retention_hours=retention_hours, enforce_retention_duration=True, dry_run=False
+        )
+        print(f"SUCCESS: vacuumed {table_path} ({len(removed)} archivos eliminados)")
+    except Exception as e:
+        print(f"ERROR vacuuming {table_path}: {e}")
+
+
 def vacuum_tables(retention_hours=168):  
     """
     Ejecuta VACUUM sobre todas las tablas Delta del data lake.
     VACUUM elimina archivos obsoletos que ya no son usados por el delta log.
     retention_hours = 168 (7 días) es el valor seguro por defecto.
     """
-    for root, dirs, files in os.walk(DATA_LAKE_ROOT):
-        if "_delta_log" in dirs:
-            table_path = root
-            print(f"VACUUM: {table_path}")
+    table_paths = list(find_delta_tables(DATA_LAKE_ROOT))
+    if not table_paths:
+        return
 
-            try:
-                vacuum(table_path, retention_hours=retention_hours, enforce_retention_duration=True)
-                print(f"SUCCESS: vacuumed {table_path}")
-            except Exception as e:
-                print(f"ERROR vacuuming {table_path}: {e}")
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(table_paths))) as executor:
+        list(executor.map(lambda path: vacuum_table(path, retention_hours), table_paths))
 
 
 if __name__ == "__main__":
-    vacuum_tables()
\ No newline at end of file
+    vacuum_tables()
@@ -0,0 +1,192 @@
+"""
+Funciones auxiliares compartidas por main.py y FranciscoPremuz_ingestion.py
+(una sola copia para que los dos caminos de ingesta no se separen).
+"""
+
+import os
+import atexit
+import functools
+import configparser
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import pyarrow as pa
+import pyarrow.compute as pc
+from deltalake import write_deltalake, DeltaTable, WriterProperties
+from deltalake.exceptions import TableNotFoundError
+
+# parquet de BRONZE comprimido con ZSTD: mejor ratio que snappy en series numéricas (menos bytes hacia S3/MinIO)
+BRONZE_WRITER_PROPERTIES = WriterProperties(compression="ZSTD", compression_level=3)
+
+# tipos de precios y volumen para una tabla de crypto nueva: float32 alcanza para BTC y reduce a la mitad
+# los bytes escritos y escaneados; en una tabla existente manda su propio esquema (ver upsert_data_as_delta)
+CRYPTO_PRICE_TYPES = {name: pa.float32() for name in ("open", "high", "low", "close", "volume")}
+
+# cantidad máxima de particiones para reemplazar con delete + append en lugar de merge
+MAX_REPLACE_PARTITIONS = 10
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@functools.lru_cache(maxsize=None)
+def load_config_file(filename):
+    # Carga un archivo .conf desde la carpeta config/ (se parsea una sola vez por archivo)
+    config_path = os.path.join(BASE_DIR, "config", filename)
+    if not os.path.exists(config_path):
+        print(f"No se encontró {config_path}.")
+        return None
+    parser = configparser.ConfigParser()
+    parser.read(config_path)
+    return parser
+
+@functools.cache
+def get_storage_options():
+    # opciones de MinIO armadas una sola vez (None si se usa almacenamiento local)
+    storage_config = load_config_file("storage.conf")
+    if not storage_config or "minio" not in storage_config:
+        return None
+    minio = storage_config["minio"]
+    return {
+        "AWS_ENDPOINT_URL": minio["AWS_ENDPOINT_URL"],
+        "AWS_ACCESS_KEY_ID": minio["AWS_ACCESS_KEY_ID"],
+        "AWS_SECRET_ACCESS_KEY": minio["AWS_SECRET_ACCESS_KEY"],
+        "AWS_ALLOW_HTTP": minio["AWS_ALLOW_HTTP"],
+        "aws_conditional_put": minio["aws_conditional_put"],
+        "AWS_S3_ALLOW_UNSAFE_RENAME": minio["AWS_S3_ALLOW_UNSAFE_RENAME"]
+    }
+
+def create_session():
+    # sesión HTTP para la API: reutiliza la conexión (keep-alive) entre llamadas
+    # y reintenta con backoff ante límite de tasa (429) o errores 5xx
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # headers fijos en la sesión (requests ya agrega Accept-Encoding: gzip, deflate por defecto)
+    session.headers.update({"Accept": "application/json"})
+    atexit.register(session.close)
+    return session
+
+def normalize_columns(cols):
+    # "1. From_Currency Code" -> "from_currency_code" (remueve el número y une con _)
+    new_columns = []
+    seen = set()
+
+    for c in cols:
+        col_name = "_".join(c.split(" ")[1:]).lower()
+
+        # Si el nombre ya existe (incluidos los generados con sufijo), agrega un sufijo numérico
+        base_name = col_name
+        counter = 1
+        while col_name in seen:
+            col_name = f"{base_name}_{counter}"
+            counter += 1
+
+        seen.add(col_name)
+        new_columns.append(col_name)
+    return new_columns
+
+def cast_columns(data, types):
+    # castea las columnas de data (tabla Arrow) que aparecen en types; el resto queda igual
+    schema = pa.schema([pa.field(f.name, types.get(f.name, f.type)) for f in data.schema])
+    return data.cast(schema)
+
+def table_types(dt):
+    # tipos de las columnas de una tabla Delta existente
+    return {field.name: field.type for field in pa.schema(dt.schema().to_arrow())}
+
+def count_rows(dt):
+    # cuenta filas con las estadísticas del delta log, sin leer los archivos parquet
+    add_actions = pa.record_batch(dt.get_add_actions(flatten=True))
+    return pc.sum(add_actions["num_records"]).as_py() or 0
+
+def max_value(dt, column):
+    # máximo de una columna con las estadísticas del delta log, sin leer los archivos parquet
+    # (si algún archivo no tiene estadísticas se lee solo esa columna); null si la tabla está vacía
+    add_actions = pa.record_batch(dt.get_add_actions(flatten=True))
+    stat = f"max.{column}"
+    if add_actions.num_rows and stat in add_actions.schema.names and add_actions[stat].null_count == 0:
+        return pc.max(add_actions[stat])
+    return pc.max(dt.to_pyarrow_table(columns=[column])[column])
+
+# write (delta)
+def save_data_as_delta(df, path, storage_options=None, mode="overwrite", partition_cols=None):  
+    # guarda los datos en formato delta lake 
+    write_deltalake(
+        path,
+        df,
+        mode=mode,
+        storage_options=storage_options,
+        partition_by=partition_cols,
+        writer_properties=BRONZE_WRITER_PROPERTIES
+    )
+
+def replace_partitions_as_delta(dt, data, partition_col, partition_values):
+    # reemplaza particiones completas: un delete por particion + un append, sin join ni reescritura de archivos
+    # (schema_mode="merge" tolera columnas heredadas de la tabla que data ya no trae)
+    values = ",".join(f"'{v}'" for v in partition_values)
+    dt.delete(f"{partition_col} IN ({values})")
+    write_deltalake(
+        dt,
+        data,
+        mode="append",
+        schema_mode="merge",
+        partition_by=[partition_col],
+        writer_properties=BRONZE_WRITER_PROPERTIES
+    )
+
+def upsert_data_as_delta(data, data_path, predicate, storage_options=None, partition_cols=None, partition_values=None,
+                         since_col=None, max_replace_partitions=0, dt=None, types=None):
+    # inserta nuevos datos o actualiza registros existentes (data es una tabla Arrow, sin copia desde pandas)
+    # dt: la tabla ya abierta por quien llama (evita reabrirla); devuelve None si la tabla se creó recién
+    # types: tipos de columna si la tabla se crea; si ya existe, data se castea a los tipos de la tabla
+    # (así una tabla float64 recibe los valores parseados con precisión completa, sin pasar por float32)
+    # con since_col solo se mergean las filas con since_col >= al máximo ya cargado en la tabla
+    # si data trae particiones completas y son a lo sumo max_replace_partitions, se usa delete + append
+    if data is None:
+        print("upsert: No hay datos para escribir.")
+        return
+    
+    try:
+        if dt is None:
+            dt = DeltaTable(data_path, storage_options=storage_options)
+        data = cast_columns(data, table_types(dt))
+        if since_col:
+            # la API devuelve toda la historia: solo interesan las filas desde el último valor cargado
+            # (incluido, porque la vela del día en curso se sigue actualizando)
+            last_value = max_value(dt, since_col)
+            if last_value.is_valid:
+                data = data.filter(pc.greater_equal(data[since_col], last_value))
+            if data.num_rows == 0:
+                print("upsert: No hay datos nuevos para cargar.")
+                return dt
+            if partition_cols and partition_values:
+                # las particiones a tocar son solo las de las filas que quedaron
+                partition_values = sorted(pc.unique(data[partition_cols[0]]).to_pylist())
+        if partition_cols and partition_values and len(partition_values) <= max_replace_partitions:
+            # pocas particiones afectadas: delete + append es mucho más barato que un merge
+            replace_partitions_as_delta(dt, data, partition_cols[0], partition_values)
+            return dt
+        if partition_cols and partition_values:
+            # filtra por particion para que delta-rs pode archivos en vez de escanear toda la tabla
+            values = ",".join(f"'{v}'" for v in partition_values)
+            predicate = f"target.{partition_cols[0]} IN ({values}) AND {predicate}"
+        dt.merge(
+            source=data,
+            source_alias="source",
+            target_alias="target",
+            predicate=predicate,
+            writer_properties=BRONZE_WRITER_PROPERTIES,
+            # fuente chica materializada: delta-rs deriva de sus valores un filtro de poda temprana
+            streamed_exec=False
+        ) \
+        .when_matched_update_all() \
+        .when_not_matched_insert_all() \
+        .execute()
+        # el merge deja dt en la última versión: se devuelve para no reabrir la tabla después
+        return dt
+    except TableNotFoundError:
+        if types:
+            data = cast_columns(data, types)
+        save_data_as_delta(data, data_path, storage_options, "overwrite", partition_cols)